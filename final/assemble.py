@@ -3,14 +3,24 @@
 Judge for teams.
 '''
 import argparse
+import collections
+import hashlib
+import json
 import math
 import os
+import random
 import warnings
 
 import judge
 
+try:
+    import numpy
+except ImportError:  # Not required on python2
+    numpy = None
+
 
 DEFAULT_TIME = 6 * 60 * 60  # 6 hours
+BOOTSTRAP_CHUNK = 1 << 22  # Elements of temporary arrays in bootstrap
 
 
 class FBetaScore():  # pylint: disable=too-few-public-methods
@@ -36,48 +46,313 @@ class FBetaScore():  # pylint: disable=too-few-public-methods
         return (1 + self.beta) / (1 / precision + self.beta / recall)
 
 
-def rank(data, size, scorer, selector):
+def _grade_turn(turn):
     '''
-    For each fault, a team gets grade based on ranking among teams.
+    Yield (team, grade) for a fault, where turn iterates (time, team) sorted by time.
+
+    Only the leading teams which get grade are visited.
+    '''
+    grade = 10
+    current_time = current_grade = None
+    for time, team in turn:
+        if time != current_time:
+            if grade <= 0 or time >= DEFAULT_TIME:
+                return
+            current_time, current_grade = time, grade
+        yield team, current_grade
+        grade -= 1
+
+
+def rank_grades(data, size, scorer, selector):
     '''
-    score = {team: 0.0 for team in data}
+    Grade of each fault for each team, based on ranking among teams.
+    '''
+    grades = {team: [0] * size for team in data}
 
     for i in range(size):
         turn = []
         for team in data:
-            turn.append((team, selector([scorer(*item) for item in data[team][i]])))
-        turn.sort(key=lambda item: item[1])
-        j = 0
-        grade = 10
-        num = len(turn)
-        while j < num and grade > 0:
-            team, time = turn[j]
-            if time >= DEFAULT_TIME:
-                break
-            current_grade = grade
-            current_time = time
-            while j < num and time == current_time:
-                score[team] += current_grade
-                grade -= 1
-                j += 1
-                if j >= num:
-                    break
-                team, time = turn[j]
-    return score
+            turn.append((selector([scorer(*item) for item in data[team][i]]), team))
+        turn.sort(key=lambda item: item[0])
+        for team, grade in _grade_turn(turn):
+            grades[team][i] = grade
+    return grades
+
+
+def rank(data, size, scorer, selector):
+    '''
+    For each fault, a team gets grade based on ranking among teams.
+    '''
+    grades = rank_grades(data, size, scorer, selector)
+    return {team: sum(grades[team], 0.0) for team in data}
+
+
+class _Node():  # pylint: disable=too-few-public-methods
+    __slots__ = ('key', 'priority', 'left', 'right')
+
+    def __init__(self, key):
+        self.key = key
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+
+
+def _split(node, key):
+    '''Split a treap into nodes less than key and the others'''
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        return node, right
+    left, node.left = _split(node.left, key)
+    return left, node
+
+
+def _merge(left, right):
+    '''Merge two treaps, where keys of left are less than the ones of right'''
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return left
+    right.left = _merge(left, right.left)
+    return right
+
+
+def _remove(node, key):
+    if node.key == key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _remove(node.left, key)
+    else:
+        node.right = _remove(node.right, key)
+    return node
+
+
+class _Turn():
+    '''
+    (time, team) of a fault kept sorted in a treap.
+
+    Adding and removing are O(log(teams)) expected, and iterating the leading
+    k teams is O(log(teams) + k).
+    '''
+    __slots__ = ('_root', )
+
+    def __init__(self):
+        self._root = None
+
+    def add(self, key):
+        '''Insert (time, team)'''
+        left, right = _split(self._root, key)
+        self._root = _merge(_merge(left, _Node(key)), right)
+
+    def remove(self, key):
+        '''Delete (time, team), which is supposed to exist'''
+        self._root = _remove(self._root, key)
+
+    def __iter__(self):
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.key
+                node = node.right
+
+
+class Tournament():
+    '''
+    Ranking state which is updated incrementally as teams resubmit.
+
+    For each fault, times of teams are kept sorted in a treap. Updating a team
+    only touches faults whose time changed, each in O(log(teams)), and the
+    leading teams, including all tied ones, are graded again.
+    Scores are identical to the ones of rank.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self.score = {}
+        self._times = {}  # team -> selected time of each fault
+        self._turns = [_Turn() for _ in range(size)]
+
+    @classmethod
+    def restore(cls, size, entries):
+        '''
+        Build the tournament at once, with each fault graded only once.
+
+        entries: [(team, times)], as the arguments of update
+        '''
+        # pylint: disable=protected-access
+        tournament = cls(size)
+        for team, times in entries:
+            if len(times) != size:
+                raise ValueError('Expect %d faults, got %d' % (size, len(times)))
+            if team in tournament._times:
+                raise ValueError('Duplicate team "%s"' % (team, ))
+            tournament.score[team] = 0.0
+            tournament._times[team] = list(times)
+            for turn, time in zip(tournament._turns, times):
+                turn.add((time, team))
+        for turn in tournament._turns:
+            tournament._grade(turn, 1)
+        return tournament
+
+    def times(self, team):
+        '''Selected time of each fault for the given team'''
+        return self._times[team]
+
+    def update(self, team, times):
+        '''
+        Replace the selected time of each fault for the given team.
+
+        times: selector([scorer(*item) for item in window]) for each fault
+        '''
+        if len(times) != self.size:
+            raise ValueError('Expect %d faults, got %d' % (self.size, len(times)))
+        previous = self._times.get(team)
+        self.score.setdefault(team, 0.0)
+        for i, time in enumerate(times):
+            if previous is not None and previous[i] == time:
+                continue
+            turn = self._turns[i]
+            self._grade(turn, -1)
+            if previous is not None:
+                turn.remove((previous[i], team))
+            turn.add((time, team))
+            self._grade(turn, 1)
+        self._times[team] = list(times)
+
+    def grades(self):
+        '''Grade of each fault for each team, the same as rank_grades'''
+        grades = {team: [0] * self.size for team in self._times}
+        for i, turn in enumerate(self._turns):
+            for team, grade in _grade_turn(turn):
+                grades[team][i] = grade
+        return grades
+
+    def _grade(self, turn, sign):
+        for team, grade in _grade_turn(turn):
+            self.score[team] += sign * grade
+
+
+def fscore_grades(data, size, scorer, selector):
+    '''
+    Grade of each fault for each team, based on f-score.
+    '''
+    return {team: [selector([scorer(*item) for item in data[team][i]])
+                   for i in range(size)] for team in data}
 
 
 def fscore(data, size, scorer, selector):
     '''
     For each fault, a team gets grade based on f-score.
     '''
-    score = {team: 0.0 for team in data}
+    grades = fscore_grades(data, size, scorer, selector)
+    return {team: sum(grades[team], 0.0) / size for team in data}
+
+
+def _percentile(data, ratio):
+    return data[min(max(int(math.ceil(ratio * len(data))) - 1, 0), len(data) - 1)]
+
+
+def _resample(size, iterations, seed):
+    '''Draw faults of all resamples at once, as an iterations x size matrix'''
+    if numpy is not None:
+        if not size:
+            return numpy.zeros((iterations, 0), dtype=int)
+        return numpy.random.RandomState(seed).randint(0, size, (iterations, size))
+    generator = random.Random(seed)
+    return [[int(generator.random() * size) for _ in range(size)]
+            for _ in range(iterations)]
+
+
+def _bootstrap_numpy(columns, faults, descending):
+    grades = numpy.array(columns, dtype=float).T.reshape((faults.shape[1], len(columns)))
+    iterations, teams = faults.shape[0], len(columns)
+    samples = numpy.empty((iterations, teams))
+    wins = numpy.zeros((teams, teams))
+    # Bound temporary arrays
+    step = max(BOOTSTRAP_CHUNK // max(faults.shape[1] * teams, teams * teams, 1), 1)
+    for i in range(0, iterations, step):
+        scores = grades[faults[i:i + step]].sum(axis=1)  # resamples x teams
+        samples[i:i + step] = scores
+        if not descending:
+            scores = -scores
+        wins += (scores[:, :, None] > scores[:, None, :]).sum(axis=0)
+        wins += 0.5 * (scores[:, :, None] == scores[:, None, :]).sum(axis=0)
+    return samples.T.tolist(), wins.tolist()
+
+
+def _bootstrap_python(columns, faults, descending):  # pylint: disable=too-many-locals
+    getters = [column.__getitem__ for column in columns]
+    teams = range(len(columns))
+    samples = [[] for _ in teams]
+    rankings = collections.Counter()
+    for picks in faults:
+        scores = [sum(map(getter, picks), 0.0) for getter in getters]
+        for sample, value in zip(samples, scores):
+            sample.append(value)
+        # One sort per resample, and pairs are compared once per distinct ranking
+        order = sorted(teams, key=scores.__getitem__, reverse=descending)
+        ranking = [0] * len(order)
+        for n, j in enumerate(order):
+            if n and scores[j] != scores[order[n - 1]]:
+                ranking[j] = n
+            elif n:
+                ranking[j] = ranking[order[n - 1]]
+        rankings[tuple(ranking)] += 1
+
+    wins = [[0.0] * len(columns) for _ in teams]
+    for ranking, count in rankings.items():
+        for j in teams:
+            for k in teams:
+                if ranking[j] < ranking[k]:
+                    wins[j][k] += count
+                elif ranking[j] == ranking[k]:
+                    wins[j][k] += 0.5 * count
+    return samples, wins
+
+
+def bootstrap(grades, iterations, descending=True, confidence=0.95, seed=None):  # pylint: disable=too-many-locals
+    '''
+    Resample faults with replacement to estimate how stable scores are.
 
-    for i in range(size):
-        for team in data:
-            score[team] += selector([scorer(*item) for item in data[team][i]])
-    for team in data:
-        score[team] /= size
-    return score
+    grades: grade of each fault for each team, e.g. output of rank_grades
+    descending: whether a higher score is better
+
+    Return confidence interval of the sum of grades for each team, and
+    probability that a team beats another, with ties counted as half.
+    Resamples are vectorized with numpy, which is required on python3.
+    Results for a given seed depend on whether numpy is installed, as
+    resamples are drawn by numpy or by random respectively.
+    '''
+    teams = list(grades)
+    size = len(grades[teams[0]]) if teams else 0
+    columns = [grades[team] for team in teams]
+    faults = _resample(size, iterations, seed)
+    if numpy is not None:
+        samples, wins = _bootstrap_numpy(columns, faults, descending)
+    else:
+        samples, wins = _bootstrap_python(columns, faults, descending)
+
+    alpha = (1 - confidence) / 2
+    interval = {}
+    for j, team in enumerate(teams):
+        data = sorted(samples[j])
+        if data:
+            interval[team] = (_percentile(data, alpha), _percentile(data, 1 - alpha))
+    probability = {
+        team: {other: wins[j][k] / iterations
+               for k, other in enumerate(teams) if k != j}
+        for j, team in enumerate(teams)
+    } if iterations else {}
+    return interval, probability
 
 
 def _get_last(data):
@@ -123,6 +398,149 @@ def create_scorer(beta):
     return scorer
 
 
+def _judge(parameters, path):
+    if parameters.workers > 1:
+        return judge.judge_sharded(parameters.answer, path,
+                                   quota=parameters.quota,
+                                   window=parameters.window,
+                                   workers=parameters.workers)
+    return judge.judge(parameters.answer, path,
+                       quota=parameters.quota,
+                       window=parameters.window)
+
+
+def _signature(path):
+    # Content rather than mtime, which copies and extraction may keep
+    digest = hashlib.sha1()
+    with open(path, 'rb') as obj:
+        for chunk in iter(lambda: obj.read(1 << 20), b''):
+            digest.update(chunk)
+    return [os.path.getsize(path), digest.hexdigest()]
+
+
+def _settings(parameters):
+    return {
+        'answer': [os.path.abspath(parameters.answer)] + _signature(parameters.answer),
+        'quota': parameters.quota,
+        'window': parameters.window,
+        'beta': parameters.beta,
+        'selector': parameters.selector,
+    }
+
+
+def _load_state(path, settings):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as obj:
+            state = json.load(obj)
+    except:  # pylint: disable=bare-except
+        warnings.warn('Failed to parse "%s"' % (path, ))
+        return {}
+    if not isinstance(state, dict) or state.get('settings') != settings:
+        # Judged with different answer or parameters
+        return {}
+    teams = state.get('teams')
+    if not isinstance(teams, dict):
+        return {}
+    return {team: entry for team, entry in teams.items()
+            if isinstance(entry, dict) and isinstance(entry.get('signature'), list)
+            and isinstance(entry.get('times'), list)}
+
+
+def _dump_state(path, settings, teams):
+    with open(path, 'w') as obj:
+        json.dump({'settings': settings, 'teams': teams}, obj)
+
+
+def _judge_changed(parameters, paths, cached, scorer, selector):
+    '''Signatures of all teams, and selected times of teams whose results changed'''
+    signatures = collections.OrderedDict()
+    changed = collections.OrderedDict()
+    for team, path in paths:
+        if team in signatures:
+            continue
+        signatures[team] = _signature(path)
+        entry = cached.get(team)
+        if entry is None or entry['signature'] != signatures[team]:
+            changed[team] = [selector([scorer(*item) for item in window_results])
+                             for window_results in _judge(parameters, path)]
+    return signatures, changed
+
+
+def play(parameters, paths, scorer, selector):
+    '''
+    Restore the tournament, with only teams whose results changed judged and updated.
+
+    Signatures and selected times of teams are kept in the file given by --state.
+    '''
+    settings = _settings(parameters)
+    cached = _load_state(parameters.state, settings)
+    signatures, changed = _judge_changed(parameters, paths, cached, scorer, selector)
+    if not signatures:
+        return None
+
+    previous = {team: cached[team]['times'] for team in signatures if team in cached}
+    sizes = set(len(times) for times in changed.values())
+    sizes.update(len(times) for times in previous.values())
+    if len(sizes) > 1:
+        warnings.warn('Results vary in size!')
+        return None
+    size = sizes.pop()
+
+    # Previous state, with teams judged for the first time at the bottom
+    tournament = Tournament.restore(size, [(team, previous.get(team, [DEFAULT_TIME] * size))
+                                           for team in signatures])
+    for team, times in changed.items():
+        tournament.update(team, times)
+
+    _dump_state(parameters.state, settings,
+                {team: {'signature': signature, 'times': tournament.times(team)}
+                 for team, signature in signatures.items()})
+    return tournament
+
+
+def _judge_all(parameters, paths):
+    data = {}
+    for team, path in paths:
+        data[team] = _judge(parameters, path)
+    size = set()
+    for team in data:
+        size.add(len(data[team]))
+    if len(size) > 1:
+        warnings.warn('Results vary in size!')
+        return None
+    return data
+
+
+def _score_tournament(parameters, tournament):
+    grades = {team: tournament.times(team) for team in tournament.score}
+    if parameters.score == 'rank':
+        if parameters.bootstrap:
+            grades = tournament.grades()
+        return tournament.score, grades
+    return {team: sum(grades[team], 0.0) / tournament.size for team in grades}, grades
+
+
+def _score_data(parameters, data, size, scorer, selector):
+    if parameters.score == 'rank':
+        grades = rank_grades(data, size, scorer, selector)
+        return {team: sum(grades[team], 0.0) for team in grades}, grades
+    grades = fscore_grades(data, size, scorer, selector)
+    return {team: sum(grades[team], 0.0) / size for team in grades}, grades
+
+
+def _print_bootstrap(parameters, grades, size):
+    interval, probability = bootstrap(grades, parameters.bootstrap,
+                                      descending=parameters.score == 'rank')
+    if parameters.score == 'fscore':
+        # Average of grades
+        interval = {team: (low / size, high / size)
+                    for team, (low, high) in interval.items()}
+    print(interval)
+    print(probability)
+
+
 def main():
     '''Entrance'''
     parser = argparse.ArgumentParser()
@@ -138,9 +556,12 @@ def main():
     parser.add_argument('--selector', choices=['last', 'best'],
                         default='last', required=False)
     parser.add_argument('--beta', type=float, default=0.5, required=False)
+    parser.add_argument('--state', type=str, default=None, required=False)
+    parser.add_argument('--bootstrap', type=int, default=0, required=False)
+    parser.add_argument('--workers', type=int, default=1, required=False)
     parameters = parser.parse_args()
 
-    data = {}
+    paths = []
     with open(parameters.team) as obj:
         for line in obj:
             team = line.strip()
@@ -148,28 +569,29 @@ def main():
             if not os.path.exists(path):
                 warnings.warn('Result for team "%s" not found' % (team, ))
                 continue
+            paths.append((team, path))
 
-            data[team] = judge.judge(parameters.answer, path,
-                                     quota=parameters.quota,
-                                     window=parameters.window)
-    size = set()
-    for team in data:
-        size.add(len(data[team]))
-    if len(size) > 1:
-        warnings.warn('Results vary in size!')
-        return
-    size = size.pop()
     scorer = create_scorer(parameters.beta)
-
-
     selector = _get_last
     if parameters.selector == 'best':
         selector = _get_best
 
-    if parameters.score == 'rank':
-        print(rank(data, size, scorer, selector))
+    if parameters.state:
+        tournament = play(parameters, paths, scorer, selector)
+        if tournament is None:
+            return
+        size = tournament.size
+        score, grades = _score_tournament(parameters, tournament)
     else:
-        print(fscore(data, size, scorer, selector))
+        data = _judge_all(parameters, paths)
+        if data is None:
+            return
+        size = len(next(iter(data.values()))) if data else 0
+        score, grades = _score_data(parameters, data, size, scorer, selector)
+    print(score)
+
+    if parameters.bootstrap:
+        _print_bootstrap(parameters, grades, size)
 
 
 if __name__ == '__main__':
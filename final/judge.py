@@ -2,14 +2,22 @@
 '''
 Compare result with answer.
 '''
+import bisect
+import csv
 import datetime
 import json
+import locale
+import math
+import multiprocessing
 import sys
 import warnings
 
 import dateutil.parser
 
 
+ENCODING = locale.getpreferredencoding(False)  # The same as open
+
+
 class Result():  # pylint: disable=too-few-public-methods
     '''Consumer of submitted answer'''
 
@@ -43,6 +51,11 @@ class Result():  # pylint: disable=too-few-public-methods
             quota += 1
         return quota
 
+    @property
+    def quota(self):
+        '''Remaining quota'''
+        return self._quota
+
 
 def _parse_indices(indices):
     # pylint: disable=unnecessary-comprehension
@@ -66,25 +79,54 @@ def _load_answer(path):
     return start_time, answers
 
 
+def _parse_line(line):
+    '''Parse a line of log as (timestamp, indices), or None if it is not an answer'''
+    if ' ' not in line:
+        return None
+    try:
+        sep = line.index(' ')
+        # Work in python3 only
+        # timestamp = dateutil.parser.parse(line[:sep]).timestamp()
+        timestamp = _get_timestamp(dateutil.parser.parse(line[:sep]))
+        return timestamp, _parse_indices(json.loads(line[sep:]))
+    except:  # pylint: disable=bare-except
+        warnings.warn('Failed to parse "%s"' % (line.strip(), ))
+    return None
+
+
 def _load_data(path):
     data = []
     with open(path) as obj:
         for line in obj:
-            if ' ' not in line:
-                continue
-            try:
-                sep = line.index(' ')
-                # Work in python3 only
-                # timestamp = dateutil.parser.parse(line[:sep]).timestamp()
-                timestamp = _get_timestamp(dateutil.parser.parse(line[:sep]))
-                data.append((timestamp, _parse_indices(json.loads(line[sep:]))))
-            except:  # pylint: disable=bare-except
-                warnings.warn('Failed to parse "%s"' % (line.strip(), ))
+            item = _parse_line(line)
+            if item is not None:
+                data.append(item)
 
     data.sort(key=lambda item: item[0])
     return data
 
 
+def _walk(answers, results):
+    '''
+    Consume submitted answers fault by fault.
+
+    Yield (timestamp, indices, found, consumed) for each fault, where
+    consumed is the quota spent by the fault, including skipped submissions.
+    '''
+    for timestamp, indices in answers:
+        quota = results.quota
+        found = results.find(timestamp)
+        yield timestamp, indices, found, quota - results.quota
+
+
+def _summarize(timestamp, indices, found):
+    num = len(indices)
+    return [(submitted_at - timestamp,
+             len(result),
+             len(result.intersection(indices)),
+             num) for submitted_at, result in found]
+
+
 def judge(answer_path, result_path, quota=24, window=10 * 60):
     '''
     Compare the submitted answer with ground truth, with a grade returned.
@@ -97,37 +139,246 @@ def judge(answer_path, result_path, quota=24, window=10 * 60):
     # 2. Summary
     data = []
 
-    for timestamp, indices in answers:
-        num = len(indices)
-        data.append([(submitted_at - timestamp,
-                      len(result),
-                      len(result.intersection(indices)),
-                      num) for submitted_at, result in results.find(timestamp)])
+    for timestamp, indices, found, _ in _walk(answers, results):
+        data.append(_summarize(timestamp, indices, found))
+
+    return data
+
+
+def _index_log(path, step):
+    '''
+    Build a sparse index of (timestamp, byte offset) with an answer every step lines.
+
+    Return None if the log is not sorted by time, or if any line has a bare
+    carriage return, which universal newlines of _load_data splits further.
+    '''
+    index = []
+    offset = 0
+    pending = False
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # Warned again by shards
+        with open(path, 'rb') as obj:
+            for i, line in enumerate(obj):
+                if b'\r' in line.rstrip(b'\n')[:-1]:
+                    return None
+                pending = pending or i % step == 0
+                item = _parse_line(line.decode(ENCODING)) if pending else None
+                if item is not None:
+                    if index and item[0] < index[-1][0]:
+                        return None
+                    index.append((item[0], offset))
+                    pending = False
+                offset += len(line)
+    return index
+
+
+def _split(answers, window, shards):
+    '''
+    Split sorted faults into at most given shards, only where windows are disjoint.
+
+    Return [(lower, upper, faults)] where a shard holds answers in [lower, upper),
+    and None stands for no bound.
+    '''
+    size = max(int(math.ceil(len(answers) / float(shards))), 1)
+    groups = [[]]
+    for i, (timestamp, _) in enumerate(answers):
+        if len(groups[-1]) >= size and answers[i - 1][0] + window < timestamp:
+            groups.append([])
+        groups[-1].append(timestamp)
+
+    bounds = [None] + [group[0] for group in groups[1:]] + [None]
+    return [(bounds[i], bounds[i + 1], group) for i, group in enumerate(groups)]
+
+
+def _judge_shard(task):  # pylint: disable=too-many-locals
+    '''
+    Load answers in a shard of log, with positions of faults in the shard.
+
+    Return whether the log is sorted by time in the byte range, number of
+    answers in the shard, number of answers before start time, and
+    (lower bound, upper bound, answers in window) of each fault.
+    '''
+    path, start, end, (lower, upper, faults), start_time, window = task
+    is_sorted = True
+    last = None
+    data = []
+    with open(path, 'rb') as obj:
+        obj.seek(start)
+        offset = start
+        for line in obj:
+            if end is not None and offset >= end:
+                break
+            offset += len(line)
+            item = _parse_line(line.decode(ENCODING))
+            if item is None:
+                continue
+            if last is not None and item[0] < last:
+                is_sorted = False
+            last = item[0]
+            if (lower is None or item[0] >= lower) and (upper is None or item[0] < upper):
+                data.append(item)
+
+    times = [timestamp for timestamp, _ in data]
+    positions = []
+    for timestamp in faults:
+        lower_bound = bisect.bisect_left(times, timestamp)
+        upper_bound = bisect.bisect_right(times, timestamp + window)
+        positions.append((lower_bound, upper_bound, data[lower_bound:upper_bound]))
+    return is_sorted, len(data), bisect.bisect_left(times, start_time), positions
+
+
+def judge_sharded(answer_path, result_path,  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+                  quota=24, window=10 * 60, workers=None, step=1024):
+    '''
+    Compare the submitted answer with ground truth, the same as judge.
 
+    Faults are split into shards where windows are disjoint, and each shard
+    is judged by a worker process, which seeks to its range of the log with
+    a sparse index of byte offsets. Quota is applied when shards are combined,
+    as the spent quota is the number of answers passed since start time.
+    Fall back to judge if the log is not sorted by time or has bare carriage returns.
+    '''
+    workers = workers or multiprocessing.cpu_count()
+    start_time, answers = _load_answer(answer_path)
+    index = _index_log(result_path, step)
+    if index is None:
+        return judge(answer_path, result_path, quota=quota, window=window)
+
+    # 1. Seek each shard to its range
+    times = [timestamp for timestamp, _ in index]
+    tasks = []
+    for shard in _split(answers, window, workers):
+        lower, upper, _ = shard
+        start, end = 0, None
+        if lower is not None:
+            i = bisect.bisect_left(times, lower)
+            start = index[i - 1][1] if i > 0 else 0
+        if upper is not None:
+            i = bisect.bisect_left(times, upper)
+            end = index[i][1] if i < len(index) else None
+        tasks.append((result_path, start, end, shard, start_time, window))
+
+    if len(tasks) > 1:
+        # Pool is not a context manager in python2
+        pool = multiprocessing.Pool(min(workers, len(tasks)))  # pylint: disable=consider-using-with
+        try:
+            outputs = pool.map(_judge_shard, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        outputs = [_judge_shard(task) for task in tasks]
+    if not all(is_sorted for is_sorted, _, _, _ in outputs):
+        return judge(answer_path, result_path, quota=quota, window=window)
+
+    # 2. Summary
+    passed = sum(before for _, _, before, _ in outputs)  # Skipped without quota
+    limit = passed + quota
+    offset = 0
+    shards = []
+    for _, total, _, positions in outputs:
+        shards.extend((offset, position) for position in positions)
+        offset += total
+    data = []
+    for (offset, (lower_bound, upper_bound, found)), (timestamp, indices) \
+            in zip(shards, answers):
+        first = max(passed, offset + lower_bound) - offset - lower_bound
+        last = min(offset + upper_bound, limit) - offset - lower_bound
+        data.append(_summarize(timestamp, indices, found[first:max(first, last)]))
+        passed = max(passed, offset + upper_bound)
     return data
 
 
+def penalty(window_results):
+    '''Time to locate a single fault, as the last submission is used.'''
+    if window_results:
+        # Get the last one
+        interval, submitted, correct, num = window_results[-1]
+    else:
+        correct = 0
+
+    if correct == 0 or correct < submitted:
+        # No answer or any wrong index
+        return 6 * 60 * 60  # 6 hours
+    recall = float(correct) / num
+    return interval / recall
+
+
 def score(results):
     '''Convert the output of judge as a single grade.'''
     grade = 0.0
     for window_results in results:
-        if window_results:
-            # Get the last one
-            interval, submitted, correct, num = window_results[-1]
-        else:
-            correct = 0
-
-        if correct == 0 or correct < submitted:
-            # No answer or any wrong index
-            grade += 6 * 60 * 60  # 6 hours
-        else:
-            recall = float(correct) / num
-            grade += interval / recall
+        grade += penalty(window_results)
     if results:
         grade /= len(results)
     return grade
 
 
+def explain(answer_path, result_path, quota=24, window=10 * 60):
+    '''
+    Report how each fault is judged.
+
+    For each fault, the window, the consumed and the remaining quota,
+    the submissions in the window, the one used and the penalty are given.
+    Skipped submissions are charged only until quota runs out.
+    '''
+    start_time, answers = _load_answer(answer_path)
+    results = Result(_load_data(result_path), quota=quota, window=window)
+    _ = results.move(start_time)
+
+    report = []
+    for timestamp, indices, found, consumed in _walk(answers, results):
+        # Quota of Result goes negative when more submissions are skipped than left
+        consumed = min(max(results.quota + consumed, 0), consumed)
+        summary = _summarize(timestamp, indices, found)
+        submissions = [{
+            'submitted_at': submitted_at,
+            'interval': interval,
+            'submitted': submitted,
+            'correct': correct,
+            'num': num,
+        } for (submitted_at, _), (interval, submitted, correct, num)
+                       in zip(found, summary)]
+        report.append({
+            'timestamp': timestamp,
+            'window': [timestamp, timestamp + window],
+            'consumed': consumed,
+            'quota': max(results.quota, 0),
+            'submissions': submissions,
+            'used': len(submissions) - 1 if submissions else None,
+            'penalty': penalty(summary),
+        })
+    return report
+
+
+def dump_explain(report, path):
+    '''Export the output of explain as json, or csv with one row per fault.'''
+    options = {'mode': 'w', }
+    if sys.version_info.major == 3:
+        options['newline'] = ''
+    with open(path, **options) as obj:
+        if path.endswith('.csv'):
+            columns = ['timestamp', 'window_start', 'window_end', 'consumed',
+                       'quota', 'submissions', 'used_at', 'interval',
+                       'submitted', 'correct', 'num', 'penalty']
+            writer = csv.writer(obj)
+            writer.writerow(columns)
+            for item in report:
+                used = {}
+                if item['used'] is not None:
+                    used = item['submissions'][item['used']]
+                writer.writerow([
+                    item['timestamp'], item['window'][0], item['window'][1],
+                    item['consumed'], item['quota'], len(item['submissions']),
+                    used.get('submitted_at', ''), used.get('interval', ''),
+                    used.get('submitted', ''), used.get('correct', ''),
+                    used.get('num', ''), item['penalty'],
+                ])
+        else:
+            # Default json
+            json.dump(report, obj, indent=2)
+
+
 def main(argv):
     '''Entrance'''
     if len(argv) < 3:
@@ -137,8 +388,16 @@ def main(argv):
     result = argv[2]
     print(answer, result)
 
-    grade = '%.04f minutes / fault' % (score(judge(answer, result)) / 60, )
-    print(grade)
+    if len(argv) > 3:
+        # Export the per-fault report, e.g. judge.py answer.json aiops.log explain.csv
+        report = explain(answer, result)
+        dump_explain(report, argv[3])
+        grade = float(sum(item['penalty'] for item in report))
+        if report:
+            grade /= len(report)
+    else:
+        grade = score(judge(answer, result))
+    print('%.04f minutes / fault' % (grade / 60, ))
 
 
 if __name__ == '__main__':
@@ -1,9 +1,14 @@
 '''
 Test suite for assemble.py
 '''
+import json
+import os
+import random
+
 import pytest
 
-from assemble import FBetaScore
+import assemble
+from assemble import DEFAULT_TIME, FBetaScore, Tournament, bootstrap, rank
 
 
 @pytest.mark.parametrize(
@@ -18,3 +23,98 @@ def test_fbetascore(beta, correct, submitted, num, expectation):
     scorer = FBetaScore(beta)
     score = scorer.calculate(correct, submitted, num)
     assert score == pytest.approx(expectation, 1e-4)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_tournament(seed):
+    '''Test assemble.Tournament against assemble.rank'''
+    generator = random.Random(seed)
+    size = 8
+    teams = ['team%d' % (i, ) for i in range(15)]
+    choices = [10, 20, 30, 40.0, DEFAULT_TIME]  # many ties
+    tournament = Tournament(size)
+    times = {}
+    for _ in range(40):
+        team = generator.choice(teams)
+        times[team] = [generator.choice(choices) for _ in range(size)]
+        tournament.update(team, times[team])
+
+        data = {team: [[(time, )] for time in value] for team, value in times.items()}
+        assert tournament.score == rank(data, size, lambda time: time, lambda data: data[-1])
+
+    restored = Tournament.restore(size, list(times.items()))
+    assert restored.score == tournament.score
+    assert restored.grades() == tournament.grades()
+    with pytest.raises(ValueError):
+        Tournament.restore(size, [('team0', [10] * (size + 1))])
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_bootstrap(monkeypatch, vectorized):
+    '''Test assemble.bootstrap'''
+    if vectorized:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(assemble, 'numpy', None)
+    grades = {
+        'team1': [10, 10, 10, 10],
+        'team2': [9, 9, 9, 9],
+        'team3': [0, 0, 10, 10],
+    }
+    interval, probability = bootstrap(grades, 1000, seed=0)
+    assert interval['team1'] == (40, 40)
+    assert interval['team2'] == (36, 36)
+    assert 0 <= interval['team3'][0] <= 20 <= interval['team3'][1] <= 40
+    assert probability['team1']['team2'] == 1.0
+    assert probability['team2']['team1'] == 0.0
+    for team in grades:
+        for other in probability[team]:
+            assert probability[team][other] + probability[other][team] == \
+                pytest.approx(1.0)
+
+    interval, probability = bootstrap(grades, 10, descending=False)
+    assert interval['team1'] == (40, 40)
+    assert probability['team2']['team1'] == 1.0
+
+
+def test_signature(tmpdir):
+    '''Test assemble._signature with the same size and mtime'''
+    # pylint: disable=protected-access
+    path = str(tmpdir.join('team.log'))
+    with open(path, 'w') as obj:
+        obj.write('1970-01-01T00:03:00.000000000Z [["docker_003",null]]\n')
+    stat = os.stat(path)
+    signature = assemble._signature(path)
+    with open(path, 'w') as obj:
+        obj.write('1970-01-01T00:03:00.000000000Z [["docker_004",null]]\n')
+    os.utime(path, (stat.st_atime, stat.st_mtime))
+    assert assemble._signature(path) != signature
+
+
+@pytest.mark.parametrize(('state', 'expectation'), [
+    ({'settings': {}}, {}),
+    ([], {}),
+    ({'settings': {}, 'teams': []}, {}),
+    ({'settings': {}, 'teams': {'team0': {'times': [10]}, 'team1': [10],
+                                'team2': {'signature': [1, 'a'], 'times': [10]}}},
+     {'team2': {'signature': [1, 'a'], 'times': [10]}}),
+])
+def test_load_state(tmpdir, state, expectation):
+    '''Test assemble._load_state with malformed state'''
+    path = str(tmpdir.join('state.json'))
+    with open(path, 'w') as obj:
+        json.dump(state, obj)
+    assert assemble._load_state(path, {}) == expectation  # pylint: disable=protected-access
+
+
+def test_bootstrap_vectorized():
+    '''Test assemble.bootstrap with numpy against the fallback'''
+    # pylint: disable=protected-access
+    numpy = pytest.importorskip('numpy')
+    generator = random.Random(0)
+    columns = [[generator.choice([0, 8, 9, 10]) for _ in range(20)] for _ in range(12)]
+    faults = numpy.random.RandomState(0).randint(0, 20, (500, 20))
+    for descending in [True, False]:
+        samples, wins = assemble._bootstrap_numpy(columns, faults, descending)
+        assert (samples, wins) == \
+            assemble._bootstrap_python(columns, faults.tolist(), descending)
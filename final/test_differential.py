@@ -0,0 +1,301 @@
+'''
+Differential test suite, comparing optimized paths with reference semantics
+
+Answers and logs are generated randomly, with quota exhaustion, equal times,
+null indices and malformed lines. Durations are recorded as properties.
+'''
+# Reference implementations are frozen copies
+# pylint: disable=duplicate-code
+import argparse
+import datetime
+import json
+import random
+import time
+import warnings
+
+import dateutil.parser
+import pytest
+
+import assemble
+import judge
+
+
+pytestmark = pytest.mark.filterwarnings('ignore::UserWarning')
+
+SEEDS = range(10)
+INDICES = [
+    ['docker_001', 'container_cpu_used'],
+    ['docker_002', None],
+    ['docker_003', 'container_mem_used'],
+    ['os_017', 'Memory_free'],
+    ['db_003', 'User_Commit'],
+]
+
+
+def _format(timestamp):
+    date = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=timestamp)
+    return date.strftime('%Y-%m-%dT%H:%M:%S.%f') + '000Z'
+
+
+def _create_answer(path, generator, faults):
+    start_time = generator.randrange(600)
+    data = []
+    timestamp = start_time
+    for _ in range(faults):
+        timestamp += generator.randrange(60, 1800)
+        data.append([timestamp, generator.sample(INDICES, generator.randint(1, 3))])
+    generator.shuffle(data)
+    with open(path, 'w') as obj:
+        json.dump({'startTime': start_time, 'data': data}, obj)
+    return max(item[0] for item in data)
+
+
+def _create_log(path, generator, end, lines, ordered=False):
+    data = []
+    for _ in range(lines):
+        # Coarse timestamps for equal times
+        timestamp = generator.randrange(0, end + 1200, generator.choice([1, 30]))
+        choice = generator.random()
+        if choice < 0.1:
+            line = '%s This is logging message.\n' % (_format(timestamp), )
+        elif choice < 0.15:
+            line = "%s {'message': 'Cannot be parsed as json'}\n" % (_format(timestamp), )
+        elif choice < 0.2:
+            line = 'no_space\n'
+        else:
+            indices = generator.sample(INDICES, generator.randint(1, 3))
+            line = '%s %s\n' % (_format(timestamp), json.dumps(indices))
+        data.append((timestamp, line))
+    if ordered:
+        # As the output of docker logs
+        data.sort(key=lambda item: item[0])
+    with open(path, 'w') as obj:
+        obj.writelines(line for _, line in data)
+
+
+def _create(tmpdir, seed, teams=1, ordered=False):
+    generator = random.Random(seed)
+    answer_path = str(tmpdir.join('answer.json'))
+    end = _create_answer(answer_path, generator, generator.randint(1, 20))
+    result_paths = []
+    for i in range(teams):
+        result_path = str(tmpdir.join('team%d.log' % (i, )))
+        _create_log(result_path, generator, end, generator.randint(0, 200), ordered)
+        result_paths.append(result_path)
+    return answer_path, result_paths
+
+
+def _timed(func, *args, **kwargs):
+    start = time.time()
+    ret = func(*args, **kwargs)
+    return ret, time.time() - start
+
+
+def _reference_load_data(path):
+    '''judge._load_data, before lines are parsed by judge._parse_line'''
+    # pylint: disable=protected-access
+    data = []
+    with open(path) as obj:
+        for line in obj:
+            if ' ' not in line:
+                continue
+            try:
+                sep = line.index(' ')
+                timestamp = judge._get_timestamp(dateutil.parser.parse(line[:sep]))
+                data.append((timestamp, judge._parse_indices(json.loads(line[sep:]))))
+            except:  # pylint: disable=bare-except
+                warnings.warn('Failed to parse "%s"' % (line.strip(), ))
+
+    data.sort(key=lambda item: item[0])
+    return data
+
+
+def _reference_judge(answer_path, result_path, quota=24, window=10 * 60):
+    '''judge.judge, before explain is added'''
+    # pylint: disable=protected-access
+    # 1. Prepare data
+    start_time, answers = judge._load_answer(answer_path)
+    results = judge.Result(_reference_load_data(result_path), quota=quota, window=window)
+    _ = results.move(start_time)
+
+    # 2. Summary
+    data = []
+
+    for timestamp, indices in answers:
+        num = len(indices)
+        data.append([(submitted_at - timestamp,
+                      len(result),
+                      len(result.intersection(indices)),
+                      num) for submitted_at, result in results.find(timestamp)])
+
+    return data
+
+
+def _reference_score(results):
+    '''judge.score, before penalty is added'''
+    grade = 0.0
+    for window_results in results:
+        if window_results:
+            # Get the last one
+            interval, submitted, correct, num = window_results[-1]
+        else:
+            correct = 0
+
+        if correct == 0 or correct < submitted:
+            # No answer or any wrong index
+            grade += 6 * 60 * 60  # 6 hours
+        else:
+            recall = float(correct) / num
+            grade += interval / recall
+    if results:
+        grade /= len(results)
+    return grade
+
+
+def _reference_rank(data, size, scorer, selector):
+    '''assemble.rank, before grades of faults are kept'''
+    # pylint: disable=redefined-outer-name
+    score = {team: 0.0 for team in data}
+
+    for i in range(size):
+        turn = []
+        for team in data:
+            turn.append((team, selector([scorer(*item) for item in data[team][i]])))
+        turn.sort(key=lambda item: item[1])
+        j = 0
+        grade = 10
+        num = len(turn)
+        while j < num and grade > 0:
+            team, time = turn[j]
+            if time >= assemble.DEFAULT_TIME:
+                break
+            current_grade = grade
+            current_time = time
+            while j < num and time == current_time:
+                score[team] += current_grade
+                grade -= 1
+                j += 1
+                if j >= num:
+                    break
+                team, time = turn[j]
+    return score
+
+
+def _reference_fscore(data, size, scorer, selector):
+    '''assemble.fscore, before grades of faults are kept'''
+    score = {team: 0.0 for team in data}
+
+    for i in range(size):
+        for team in data:
+            score[team] += selector([scorer(*item) for item in data[team][i]])
+    for team in data:
+        score[team] /= size
+    return score
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize(('quota', 'window'), [(1, 600), (4, 600), (24, 600), (24, 3600)])
+def test_explain(tmpdir, record_property, seed, quota, window):
+    '''Test judge.explain, judge.judge and judge.score against the reference'''
+    answer_path, (result_path, ) = _create(tmpdir, seed)
+    expectation, elapsed = _timed(_reference_judge, answer_path, result_path,
+                                  quota=quota, window=window)
+    record_property('reference', elapsed)
+    report, elapsed = _timed(judge.explain, answer_path, result_path,
+                             quota=quota, window=window)
+    record_property('optimized', elapsed)
+    data = judge.judge(answer_path, result_path, quota=quota, window=window)
+    assert data == expectation
+    assert judge.score(data) == _reference_score(expectation)
+
+    assert len(report) == len(expectation)
+    remaining = quota
+    for item, window_results in zip(report, expectation):
+        assert [(submission['interval'], submission['submitted'],
+                 submission['correct'], submission['num'])
+                for submission in item['submissions']] == window_results
+        assert item['penalty'] == _reference_score([window_results])
+        assert item['window'] == [item['timestamp'], item['timestamp'] + window]
+        assert 0 <= item['consumed'] <= remaining
+        remaining -= item['consumed']
+        assert item['quota'] == remaining
+        assert len(item['submissions']) <= max(quota, 0)
+    assert sum(item['penalty'] for item in report) / max(len(report), 1) == \
+        pytest.approx(_reference_score(expectation))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('selector', [assemble._get_last, assemble._get_best])  # pylint: disable=protected-access
+def test_rank(tmpdir, record_property, seed, selector):
+    '''Test assemble.rank, assemble.fscore and assemble.Tournament'''
+    # pylint: disable=too-many-locals
+    answer_path, result_paths = _create(tmpdir, seed, teams=12)
+    data = {}
+    for i, result_path in enumerate(result_paths):
+        data['team%d' % (i, )] = judge.judge(answer_path, result_path, quota=4)
+    size = len(data['team0'])
+    scorer = assemble.create_scorer(0.5)
+
+    expectation, elapsed = _timed(_reference_rank, data, size, scorer, selector)
+    record_property('reference', elapsed)
+    score, elapsed = _timed(assemble.rank, data, size, scorer, selector)
+    record_property('optimized', elapsed)
+    assert score == expectation
+    assert _reference_fscore(data, size, scorer, selector) == \
+        assemble.fscore(data, size, scorer, selector)
+
+    # Teams resubmit one by one
+    generator = random.Random(seed)
+    tournament = assemble.Tournament(size)
+    grades = assemble.fscore_grades(data, size, scorer, selector)
+    for team in data:
+        tournament.update(team, [assemble.DEFAULT_TIME] * size)
+    for team in generator.sample(list(data), len(data)):
+        tournament.update(team, grades[team])
+    assert tournament.score == expectation
+    assert tournament.grades() == assemble.rank_grades(data, size, scorer, selector)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_play(tmpdir, seed):
+    '''Test assemble.play with state against the reference'''
+    answer_path, result_paths = _create(tmpdir, seed, teams=6)
+    parameters = argparse.Namespace(answer=answer_path, quota=4, window=600, beta=0.5,
+                                    selector='last', workers=1,
+                                    state=str(tmpdir.join('state.json')))
+    scorer = assemble.create_scorer(parameters.beta)
+    selector = assemble._get_last  # pylint: disable=protected-access
+    paths = [('team%d' % (i, ), path) for i, path in enumerate(result_paths[:-1])]
+    generator = random.Random(seed)
+    for i in range(4):
+        if i == 2:
+            # A team joins late
+            paths.append(('team%d' % (len(paths), ), result_paths[-1]))
+        elif i:
+            # A team resubmits
+            _create_log(generator.choice(result_paths), generator, 36000, 50)
+        data = {team: judge.judge(answer_path, path, quota=4) for team, path in paths}
+        size = len(data['team0'])
+        tournament = assemble.play(parameters, paths, scorer, selector)
+        assert tournament.score == _reference_rank(data, size, scorer, selector)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize(('quota', 'window', 'ordered', 'step'), [
+    (1, 600, True, 1),
+    (4, 600, True, 5),
+    (24, 600, True, 1),
+    (24, 3600, True, 5),
+    (4, 600, False, 5),
+])
+def test_judge_sharded(tmpdir, record_property, seed, quota, window, ordered, step):
+    '''Test judge.judge_sharded against the reference'''
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    answer_path, (result_path, ) = _create(tmpdir, seed, ordered=ordered)
+    expectation, elapsed = _timed(_reference_judge, answer_path, result_path,
+                                  quota=quota, window=window)
+    record_property('reference', elapsed)
+    data, elapsed = _timed(judge.judge_sharded, answer_path, result_path,
+                           quota=quota, window=window, workers=3, step=step)
+    record_property('optimized', elapsed)
+    assert data == expectation
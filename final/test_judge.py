@@ -1,6 +1,7 @@
 '''
 Test suite for judge.py
 '''
+import json
 import os
 
 import pytest
@@ -31,3 +32,66 @@ def test_judge(quota, expectation):
 def test_function():
     '''SmokeTest for judge.main'''
     judge.main(['judge.py', SAMPLE_ANSWER, SAMPLE_RESULT])
+
+
+@pytest.mark.parametrize('quota', [2, 3, 4, 5, 6])
+def test_explain(quota):
+    '''Test judge.explain against judge.judge'''
+    report = judge.explain(SAMPLE_ANSWER, SAMPLE_RESULT, quota=quota, window=WINDOW)
+    grade = judge.score(judge.judge(SAMPLE_ANSWER, SAMPLE_RESULT,
+                                    quota=quota, window=WINDOW))
+    assert len(report) == 1
+    assert report[0]['penalty'] == pytest.approx(grade, 1e-4)
+    assert report[0]['quota'] == max(quota - 5, 0)
+
+
+@pytest.mark.parametrize('filename', ['explain.json', 'explain.csv'])
+def test_dump_explain(tmpdir, filename):
+    '''Test judge.dump_explain'''
+    path = str(tmpdir.join(filename))
+    judge.main(['judge.py', SAMPLE_ANSWER, SAMPLE_RESULT, path])
+    with open(path) as obj:
+        lines = obj.read().strip().split('\n')
+    if filename.endswith('.csv'):
+        # one row for header and one row for the fault
+        assert len(lines) == 2
+    else:
+        assert json.loads('\n'.join(lines))[0]['used'] is not None
+
+
+@pytest.mark.parametrize('quota', [2, 3, 4, 5, 6])
+def test_judge_sharded(quota):
+    '''Test judge.judge_sharded against judge.judge'''
+    data = judge.judge_sharded(SAMPLE_ANSWER, SAMPLE_RESULT, quota=quota, window=WINDOW,
+                               workers=2, step=1)
+    assert data == judge.judge(SAMPLE_ANSWER, SAMPLE_RESULT, quota=quota, window=WINDOW)
+
+
+def test_explain_exhausted(tmpdir):
+    '''Test judge.explain after quota runs out'''
+    answer_path = str(tmpdir.join('answer.json'))
+    result_path = str(tmpdir.join('result.log'))
+    with open(answer_path, 'w') as obj:
+        json.dump({'startTime': 0, 'data': [
+            [1000, [['docker_003', 'container_cpu_used']]],
+            [3000, [['docker_003', 'container_cpu_used']]],
+        ]}, obj)
+    with open(result_path, 'w') as obj:
+        for minute in range(1, 18, 4):  # 60 s to 1020 s
+            obj.write('1970-01-01T00:%02d:00.000000000Z [["docker_003","container_cpu_used"]]\n'
+                      % (minute, ))
+    report = judge.explain(answer_path, result_path, quota=2)
+    assert [(item['consumed'], item['quota']) for item in report] == [(2, 0), (0, 0)]
+
+
+def test_judge_sharded_carriage_return(tmpdir):
+    '''Test judge.judge_sharded with bare carriage returns, split by universal newlines'''
+    result_path = str(tmpdir.join('result.log'))
+    with open(SAMPLE_RESULT, 'rb') as obj:
+        lines = obj.read().split(b'\n')
+    with open(result_path, 'wb') as obj:
+        obj.write(b'\r'.join(lines[:3]) + b'\n' + b'\r\n'.join(lines[3:]))
+    data = judge.judge_sharded(SAMPLE_ANSWER, result_path, quota=6, window=WINDOW,
+                               workers=2, step=1)
+    assert data == judge.judge(SAMPLE_ANSWER, result_path, quota=6, window=WINDOW)
+    assert data == judge.judge(SAMPLE_ANSWER, SAMPLE_RESULT, quota=6, window=WINDOW)
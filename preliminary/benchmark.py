@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+'''
+Compare memory and time for loading submitted answers.
+
+Execute with "python3 benchmark.py [number of rows per fault]".
+'''
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import judge
+
+
+def _create(directory, rows, faults=100):
+    answer_path = os.path.join(directory, 'answer.json')
+    result_path = os.path.join(directory, 'result.csv')
+    generator = random.Random(0)
+    categories = ['os', 'docker', 'db']
+    answers = {}
+    for fault_id in range(faults):
+        category = generator.choice(categories)
+        answers[fault_id] = (category, '%s_%03d' % (category, generator.randrange(30)),
+                             ['index_%d' % (generator.randrange(50), )])
+    with open(answer_path, 'w') as obj:
+        json.dump(answers, obj)
+    with open(result_path, 'w') as obj:
+        obj.write('fault_id,rank,category,cmdb_id,index\n')
+        for fault_id in range(faults):
+            # Correct answer at a leading rank for half of faults
+            correct_rank = generator.randrange(min(rows, 3) if generator.random() < 0.5 else rows)
+            for rank in range(rows):
+                if rank == correct_rank:
+                    category, cmdb_id, (index, ) = answers[fault_id]
+                    obj.write('%d,%d,%s,%s,%s\n' % (fault_id, rank, category, cmdb_id, index))
+                    continue
+                category = generator.choice(categories)
+                obj.write('%d,%d,%s,%s_%03d,index_%d\n' % (
+                    fault_id, rank, category, category,
+                    generator.randrange(30), generator.randrange(50)))
+    return answer_path, result_path
+
+
+def _measure(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    data = func(*args)
+    elapsed = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return current, peak, elapsed
+
+
+def _reference_grade(answers, result_path, grade_gradient=(100, 20)):
+    results, _ = judge._load_data(result_path)  # pylint: disable=protected-access
+    grade = 0.0
+    for i in answers:
+        if i not in results:
+            continue
+        rank = judge.get_rank(results[i], answers[i])
+        if rank is not None and rank < len(grade_gradient):
+            grade += grade_gradient[rank]
+    return round(grade / len(answers), 4)
+
+
+def main(argv):  # pylint: disable=too-many-locals
+    '''Entrance'''
+    rows = int(argv[1]) if len(argv) > 1 else 2000
+    directory = tempfile.mkdtemp()
+    try:
+        answer_path, result_path = _create(directory, rows)
+        answers, _ = judge._load_answer(answer_path)  # pylint: disable=protected-access
+        symbols = judge.Symbols(answers)
+
+        print('%d rows' % (rows * len(answers), ))
+        for name, func, args in [
+                ('Result', judge._load_data, (result_path, )),  # pylint: disable=protected-access
+                ('ResultTable', judge._load_table,  # pylint: disable=protected-access
+                 (result_path, symbols)),
+        ]:
+            current, peak, elapsed = _measure(func, *args)
+            print('%-12s retained %8.2f MB, peak %8.2f MB, %.2f s' % (
+                name, current / 2.0 ** 20, peak / 2.0 ** 20, elapsed))
+
+        start = time.time()
+        grade = judge.judge(answer_path, result_path)['data']
+        print('judge %.4f in %.2f s, ranks compared with %s' % (
+            grade, time.time() - start, 'python' if judge.numpy is None else 'numpy'))
+        expectation = _reference_grade(answers, result_path)
+        print('judge with Result %.4f' % (expectation, ))
+        assert grade == expectation, 'Grades differ'
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
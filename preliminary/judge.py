@@ -2,12 +2,20 @@
 '''
 Compare result with answer.
 '''
+from array import array
 import csv
 import json
+import math
 import os
+import random
 import sys
 import warnings
 
+try:
+    import numpy
+except ImportError:  # Optional, rows are scanned in python without it
+    numpy = None
+
 
 def _upper(item):
     if not item:
@@ -101,6 +109,153 @@ def _load_data(path):
     return data, message
 
 
+class Symbols():
+    '''
+    Interned ids of the values in ground truth.
+
+    Values absent from ground truth never match, and share the id -1.
+    '''
+
+    __slots__ = ['_ids']
+
+    def __init__(self, answers):
+        self._ids = {}
+        for answer in answers.values():
+            for value in (answer.category, answer.cmdb_id):
+                self._ids.setdefault(value, len(self._ids))
+            for value in answer.candidates:
+                self._ids.setdefault(value, len(self._ids))
+
+    def get(self, value):
+        '''Get the id of given value'''
+        return self._ids.get(value, -1)
+
+    def get_row(self, category, cmdb_id, index):
+        '''Get ids of a submitted answer, normalized the same as Result'''
+        get = self._ids.get
+        return (get(category.upper(), -1), get(cmdb_id.upper(), -1),
+                get(index.upper() if index else None, -1))
+
+    def compile(self, answer):
+        '''Convert ground truth as (category, cmdb_id, candidates) in ids'''
+        return (self.get(answer.category), self.get(answer.cmdb_id),
+                frozenset(self.get(value) for value in answer.candidates))
+
+
+class ResultTable():
+    '''
+    Submitted answers of a fault ordered by rank, kept as columns of interned ids.
+    '''
+
+    __slots__ = ['category', 'cmdb_id', 'index']
+
+    def __init__(self):
+        self.category = array('i')
+        self.cmdb_id = array('i')
+        self.index = array('i')
+
+    def __len__(self):
+        return len(self.category)
+
+    def append(self, symbols, category, cmdb_id, index):
+        '''Append a submitted answer, normalized the same as Result'''
+        category, cmdb_id, index = symbols.get_row(category, cmdb_id, index)
+        self.category.append(category)
+        self.cmdb_id.append(cmdb_id)
+        self.index.append(index)
+
+    def reorder(self, order):
+        '''Rearrange rows with the given indices'''
+        for name in self.__slots__:
+            column = getattr(self, name)
+            setattr(self, name, array('i', [column[i] for i in order]))
+
+    def get_rank(self, answer):
+        '''
+        Get the rank of correct result, with answer compiled by Symbols.
+
+        Columns are compared in a vectorized way with numpy, or scanned row by
+        row in python without it.
+        '''
+        category, cmdb_id, candidates = answer
+        if numpy is not None:
+            if not self.category:
+                return None
+            columns = [numpy.frombuffer(getattr(self, name), dtype=numpy.intc)
+                       for name in self.__slots__]
+            matched = numpy.flatnonzero((columns[0] == category) & (columns[1] == cmdb_id) &
+                                        numpy.isin(columns[2], list(candidates)))
+            return int(matched[0]) if matched.size else None
+        for rank, row in enumerate(zip(self.category, self.cmdb_id, self.index)):
+            if row[0] == category and row[1] == cmdb_id and row[2] in candidates:
+                return rank
+        return None
+
+
+def _sort_ranks(data, ranks, rank_ids):
+    '''
+    Sort rows of each fault by rank as string, the same as _load_data.
+
+    ranks: interned id of rank for each row, where rank_ids maps ranks to ids
+    '''
+    position = array('i', [0]) * len(rank_ids)
+    for i, rank in enumerate(sorted(rank_ids)):
+        position[rank_ids[rank]] = i
+    for fault_id in data:
+        key = [position[i] for i in ranks.pop(fault_id)]
+        data[fault_id].reorder(sorted(range(len(key)), key=key.__getitem__))
+
+
+def _load_csv(obj, symbols):
+    '''Load rows of submitted answers into ResultTable, sorted the same as _load_data'''
+    data = {}
+    columns = {}  # fault_id -> appenders of columns and interned ranks
+    ranks = {}
+    rank_ids = {}  # Ranks are interned rather than kept per row
+    reader = csv.reader(obj)
+    next(reader)  # header
+    for row in reader:
+        if len(row) != 5:
+            row = (row + [''] * 5)[:5]
+        fault_id, rank, category, cmdb_id, index = row
+        appenders = columns.get(fault_id)
+        if appenders is None:
+            table = data[fault_id] = ResultTable()
+            ranks[fault_id] = array('i')
+            appenders = columns[fault_id] = (
+                table.category.append, table.cmdb_id.append, table.index.append,
+                ranks[fault_id].append)
+        category, cmdb_id, index = symbols.get_row(category, cmdb_id, index)
+        appenders[0](category)
+        appenders[1](cmdb_id)
+        appenders[2](index)
+        appenders[3](rank_ids.setdefault(rank, len(rank_ids)))
+    columns.clear()  # Appenders keep columns alive, which are replaced once reordered
+    _sort_ranks(data, ranks, rank_ids)
+    return data
+
+
+def _load_table(path, symbols):
+    '''Load submitted answers as ResultTable, the same as _load_data'''
+    data = {}
+    message = ''
+    try:
+        with open(path) as obj:
+            if path.endswith('.csv'):
+                data = _load_csv(obj, symbols)
+            else:
+                data = json.load(obj)
+                for fault_id in data:
+                    table = ResultTable()
+                    for category, cmdb_id, index in data[fault_id]:
+                        table.append(symbols, category, cmdb_id, index)
+                    data[fault_id] = table
+    except:  # pylint: disable=bare-except
+        message = 'Failed to parse "%s"' % (path, )
+        data = {}
+    return data, message
+
+
 def get_rank(results, answer):
     '''Get the rank of correct result'''
     for index, result in enumerate(results):
@@ -109,36 +264,74 @@ def get_rank(results, answer):
     return None
 
 
-def judge(answer_path, result_path, grade_gradient=(100, 20)):
+def _grade_faults(answers, results, symbols, grade_gradient):
+    grades = []
+    for i in answers:
+        rank = None
+        if i in results:
+            rank = results[i].get_rank(symbols.compile(answers[i]))
+        if rank is not None and rank < len(grade_gradient):
+            grades.append(grade_gradient[rank])
+        else:
+            grades.append(0)
+    return grades
+
+
+def _percentile(data, ratio):
+    return data[min(max(int(math.ceil(ratio * len(data))) - 1, 0), len(data) - 1)]
+
+
+def bootstrap(grades, iterations, confidence=0.95, seed=None):
+    '''
+    Resample faults with replacement to estimate how stable the grade is.
+
+    grades: grade of each fault
+    Return confidence interval of the average grade.
+    '''
+    if not grades or not iterations:
+        return None
+    generator = random.Random(seed)
+    size = len(grades)
+    samples = sorted(
+        sum(map(grades.__getitem__, [int(generator.random() * size) for _ in range(size)]),
+            0.0) / size
+        for _ in range(iterations))
+    alpha = (1 - confidence) / 2
+    return _percentile(samples, alpha), _percentile(samples, 1 - alpha)
+
+
+def judge(answer_path, result_path, grade_gradient=(100, 20), iterations=0, seed=None):
     '''
     Compare the submitted answer with ground truth, with a grade returned.
+
+    With iterations of bootstrap, confidence interval of the grade is also returned.
     '''
     message = []
     # 1. Prepare data
     answers, error = _load_answer(answer_path)
     if error:
         message.append(error)
-    results, error = _load_data(result_path)
+    symbols = Symbols(answers)
+    results, error = _load_table(result_path, symbols)
     if error:
         message.append(error)
 
-    # 2. Grade
-    grade = 0.0
-    for i in answers:
-        if i not in results:
-            continue
-        rank = get_rank(results[i], answers[i])
-        if rank is not None and rank < len(grade_gradient):
-            grade += grade_gradient[rank]
+    # 2. Grade of each fault
+    grades = _grade_faults(answers, results, symbols, grade_gradient)
 
+    grade = sum(grades, 0.0)
     if answers:
         grade = grade / len(answers)
-    return {
+    ret = {
         'result': True,
         'total_fscore': "",
         'message': '\n'.join(message),
         'data': round(grade, 4),
     }
+    if iterations:
+        interval = bootstrap(grades, iterations, seed=seed)
+        ret['interval'] = [round(value, 4) for value in interval] if interval else None
+    return ret
 
 
 def _dump_answer(data, path):
@@ -203,11 +396,14 @@ def main(argv):
         action = 'judge'
         answer = argv[1]
         result = argv[2]
+    # Iterations of bootstrap, e.g. judge.py answer.json result.csv 10000
+    iterations = int(argv[3]) if len(argv) > 3 else 0
 
     if action == 'demo':
         _demo(answer, result)
     elif action == 'judge':
-        print(json.dumps(judge(answer, result, grade_gradient=(1.0, 0.2))))
+        print(json.dumps(judge(answer, result, grade_gradient=(1.0, 0.2),
+                               iterations=iterations)))
 
     return answer, result, action
 
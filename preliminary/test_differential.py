@@ -0,0 +1,136 @@
+'''
+Differential test suite, comparing ResultTable with Result
+
+Answers and results are generated randomly, with null indices, mixed cases,
+ranks sorted as strings, short rows and malformed files.
+Durations are recorded as properties.
+'''
+import csv
+import json
+import os
+import random
+import sys
+import time
+
+import pytest
+
+import judge
+
+
+SEEDS = range(20)
+CATEGORIES = ['os', 'docker', 'db']
+INDICES = ['CPU_user_time', 'Memory_free', 'User_Commit', None]
+
+
+def _cmdb_id(generator, category):
+    return '%s_%03d' % (category, generator.randrange(3))
+
+
+def _case(generator, value):
+    if value is None:
+        return value
+    return generator.choice([value, value.upper(), value.lower()])
+
+
+def _create_answer(path, generator, faults):
+    data = {}
+    for fault_id in range(faults):
+        category = generator.choice(CATEGORIES)
+        data[fault_id] = (category, _cmdb_id(generator, category),
+                          generator.sample(INDICES, generator.randint(1, 3)))
+    with open(path, 'w') as obj:
+        json.dump(data, obj)
+    return data
+
+
+def _create_row(generator, answers, fault_id):
+    if fault_id in answers and generator.random() < 0.2:
+        category, cmdb_id, candidates = answers[fault_id]
+        index = generator.choice(candidates)
+    else:
+        category = generator.choice(CATEGORIES)
+        cmdb_id = _cmdb_id(generator, category)
+        index = generator.choice(INDICES)
+    return [_case(generator, category), _case(generator, cmdb_id), _case(generator, index)]
+
+
+def _dump_csv(path, generator, data):
+    options = {'mode': 'w', }
+    if sys.version_info.major == 3:
+        options['newline'] = ''
+    with open(path, **options) as obj:
+        writer = csv.writer(obj)
+        writer.writerow(['fault_id', 'rank', 'category', 'cmdb_id', 'index'])
+        rows = []
+        for fault_id, items in data.items():
+            for rank, (category, cmdb_id, index) in enumerate(items):
+                row = [fault_id, rank, category, cmdb_id, '' if index is None else index]
+                if generator.random() < 0.05:
+                    row = row[:generator.randint(1, 4)]  # Short row
+                rows.append(row)
+        generator.shuffle(rows)
+        writer.writerows(rows)
+
+
+def _create_result(path, generator, answers, faults):
+    data = {}
+    for fault_id in range(faults):
+        if generator.random() < 0.1:
+            continue  # Missing fault
+        data[fault_id] = [_create_row(generator, answers, fault_id)
+                          for _ in range(generator.randint(1, 15))]
+
+    if path.endswith('.csv'):
+        _dump_csv(path, generator, data)
+        return
+    if generator.random() < 0.1:
+        data[0] = [[None, 'docker_001', None]]  # Malformed
+    with open(path, 'w') as obj:
+        json.dump(data, obj)
+
+
+def _reference_judge(answer_path, result_path, grade_gradient):
+    '''Grade and messages of judge.judge, with Result'''
+    # pylint: disable=protected-access
+    answers, answer_error = judge._load_answer(answer_path)
+    results, result_error = judge._load_data(result_path)
+    ranks = [judge.get_rank(results[i], answers[i]) for i in answers if i in results]
+    grade = sum(grade_gradient[rank] for rank in ranks
+                if rank is not None and rank < len(grade_gradient))
+    if answers:
+        grade = float(grade) / len(answers)
+    return round(grade, 4), '\n'.join(error for error in (answer_error, result_error) if error)
+
+
+def _timed(func, *args, **kwargs):
+    start = time.time()
+    ret = func(*args, **kwargs)
+    return ret, time.time() - start
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('extension', ['.csv', '.json'])
+@pytest.mark.parametrize('grade_gradient', [(100, 20), (1.0, 0.5, 0.25, 0.125)])
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_judge(monkeypatch, storage, record_property, seed, extension, grade_gradient,
+               vectorized):
+    '''Test judge.judge against judge with Result'''
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    if vectorized:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(judge, 'numpy', None)
+    generator = random.Random(seed)
+    answer_path = os.path.join(storage, 'test_differential_answer.json')
+    result_path = os.path.join(storage, 'test_differential_result' + extension)
+    faults = generator.randint(1, 30)
+    answers = _create_answer(answer_path, generator, faults)
+    _create_result(result_path, generator, answers, faults + 2)
+
+    expectation, elapsed = _timed(_reference_judge, answer_path, result_path,
+                                  grade_gradient=grade_gradient)
+    record_property('reference', elapsed)
+    ret, elapsed = _timed(judge.judge, answer_path, result_path,
+                          grade_gradient=grade_gradient)
+    record_property('optimized', elapsed)
+    assert (ret['data'], ret['message']) == expectation
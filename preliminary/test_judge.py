@@ -69,3 +69,39 @@ def test_function(capsys):
     captured = capsys.readouterr()
     ret = json.loads(captured.out)
     assert ret['data'] == pytest.approx(0.3, 1e-4), ret['message']
+
+
+@pytest.mark.parametrize('result_path', [
+    os.path.join(BASE_DIR, 'sample_result.csv'),
+    'nonexisstent_result.json',
+])
+def test_load_table(result_path):
+    '''Test judge._load_table against judge._load_data'''
+    # pylint: disable=protected-access
+    answers, _ = judge._load_answer(os.path.join(BASE_DIR, 'answer', 'answer-0411.json'))
+    symbols = judge.Symbols(answers)
+    tables, message = judge._load_table(result_path, symbols)
+    results, expectation = judge._load_data(result_path)
+    assert message == expectation
+    assert sorted(tables) == sorted(results)
+    for fault_id in results:
+        assert len(tables[fault_id]) == len(results[fault_id])
+        if fault_id in answers:
+            assert tables[fault_id].get_rank(symbols.compile(answers[fault_id])) == \
+                judge.get_rank(results[fault_id], answers[fault_id])
+
+
+def test_bootstrap():
+    '''Test judge.bootstrap and the interval of judge.judge'''
+    answer_path = os.path.join(BASE_DIR, 'answer', 'answer-0411.json')
+    result_path = os.path.join(BASE_DIR, 'sample_result.csv')
+    assert 'interval' not in judge.judge(answer_path, result_path)
+    ret = judge.judge(answer_path, result_path, iterations=1000, seed=0)
+    lower, upper = ret['interval']
+    assert lower <= ret['data'] <= upper
+    assert ret == judge.judge(answer_path, result_path, iterations=1000, seed=0)
+
+    assert judge.bootstrap([], 1000) is None
+    assert judge.bootstrap([20, 20, 20], 1000, seed=0) == (20, 20)
+    lower, upper = judge.bootstrap([100] * 10 + [0] * 10, 1000, seed=0)
+    assert 0 < lower < 50 < upper < 100